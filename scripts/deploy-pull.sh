@@ -0,0 +1,29 @@
+#!/bin/bash
+# Pull-based deployment for the lab machine.
+# Starts the Python deployment watcher, which polls DEPLOY_SOURCE with
+# conditional requests and reloads gunicorn in place on a change.
+#
+# Use this for a gunicorn running directly on the lab machine, started from
+# src/ with:
+#   gunicorn -c gunicorn.conf.py app:app
+# The container runs its own watcher: set DEPLOY_SOURCE in .env and the
+# entrypoint (deploy_watcher.py supervise) starts it next to gunicorn;
+# updates to the mounted ./ directory are then reloaded in place.
+#
+# Examples:
+#   DEPLOY_SOURCE=/tmp/reprolab-version ./deploy-pull.sh          # local stand-in
+#   DEPLOY_SOURCE=https://api.github.com/repos/OWNER/REPO/commits/main \
+#   DEPLOY_UPDATE_COMMAND="git -C /srv/reprolab pull --ff-only" ./deploy-pull.sh
+set -euo pipefail
+
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+SRC_DIR="${SRC_DIR:-$SCRIPT_DIR/../src}"
+
+export DEPLOY_SOURCE="${DEPLOY_SOURCE:?Set DEPLOY_SOURCE to a file, URL or git:<remote>#<ref>}"
+export DEPLOY_MIN_INTERVAL="${DEPLOY_MIN_INTERVAL:-30}"
+export DEPLOY_MAX_INTERVAL="${DEPLOY_MAX_INTERVAL:-600}"
+export GUNICORN_PIDFILE="${GUNICORN_PIDFILE:-/tmp/reprolab-gunicorn.pid}"
+export DEPLOY_STATE_FILE="${DEPLOY_STATE_FILE:-/tmp/reprolab-deploy.json}"
+
+cd "$SRC_DIR"
+exec python3 deploy_watcher.py
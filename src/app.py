@@ -7,8 +7,14 @@ import os
 import socket
 import time
 from datetime import datetime
-from flask import Flask, jsonify, render_template_string
+from flask import Flask, Response, jsonify, render_template_string, request
 import psutil  # For system resource monitoring
+from compression import Compression
+from memory_budget import MemoryBudget, container_memory
+from io_probe import IOProbe
+from io_rates import IORateSampler
+from thread_stats import ThreadProfiler
+from deploy_watcher import DEFAULT_STATE_FILE, code_fingerprint, read_state, watcher_running
 
 app = Flask(__name__)
 
@@ -19,75 +25,118 @@ app.config.update(
     DEBUG=os.getenv('FLASK_DEBUG', 'False').lower() == 'true',
     HOSTNAME=os.getenv('HOSTNAME', socket.gethostname()),
     VERSION=os.getenv('APP_VERSION', '1.0.0'),
-    DEPLOYMENT_TIME=os.getenv('DEPLOYMENT_TIME', datetime.now().isoformat())
+    DEPLOYMENT_TIME=os.getenv('DEPLOYMENT_TIME', datetime.now().isoformat()),
+    # Response compression (gzip always; brotli/zstd when installed)
+    COMPRESS_LEVEL=int(os.getenv('COMPRESS_LEVEL', '6')),
+    COMPRESS_MIN_SIZE=int(os.getenv('COMPRESS_MIN_SIZE', '500')),
+    # Per-worker memory budget (0 disables a limit); see gunicorn.conf.py
+    WORKER_MEMORY_BUDGET_MB=int(os.getenv('WORKER_MEMORY_BUDGET_MB', '100')),
+    WORKER_MAX_REQUESTS=int(os.getenv('WORKER_MAX_REQUESTS', '5000')),
+    WORKER_MEMORY_GROWTH_MB=int(os.getenv('WORKER_MEMORY_GROWTH_MB', '40')),
+    WORKER_MEMORY_CHECK_EVERY=int(os.getenv('WORKER_MEMORY_CHECK_EVERY', '10')),
+    MEMORY_STATE_DIR=os.getenv('MEMORY_STATE_DIR'),
+    # Disk I/O probe (per-worker temp files under IO_PROBE_DIR)
+    IO_PROBE_DIR=os.getenv('IO_PROBE_DIR'),
+    IO_PROBE_INTERVAL_SECONDS=int(os.getenv('IO_PROBE_INTERVAL_SECONDS', '30')),
+    IO_PROBE_SLOW_MS=float(os.getenv('IO_PROBE_SLOW_MS', '50')),
+    IO_BENCH_MAX_MB=int(os.getenv('IO_BENCH_MAX_MB', '64')),
+    # Network/disk/CPU counter sampling for the rolling rates in /info
+    IO_RATES_INTERVAL_SECONDS=float(os.getenv('IO_RATES_INTERVAL_SECONDS', '2')),
+    # Written by deploy_watcher.py, reported by /deployment
+    DEPLOY_STATE_FILE=os.getenv('DEPLOY_STATE_FILE', DEFAULT_STATE_FILE)
 )
 
+# The code this process imported; deploy_watcher.py compares it with the
+# code on disk to confirm a reload actually picked up an update
+CODE_FINGERPRINT = code_fingerprint(os.path.dirname(os.path.abspath(__file__)))
+
+compression = Compression(app)
+memory_budget = MemoryBudget(
+    budget_mb=app.config['WORKER_MEMORY_BUDGET_MB'],
+    max_requests=app.config['WORKER_MAX_REQUESTS'],
+    growth_mb=app.config['WORKER_MEMORY_GROWTH_MB'],
+    check_every=app.config['WORKER_MEMORY_CHECK_EVERY'],
+    state_dir=app.config['MEMORY_STATE_DIR']
+)
+io_probe = IOProbe(
+    base_dir=app.config['IO_PROBE_DIR'],
+    interval=app.config['IO_PROBE_INTERVAL_SECONDS'],
+    slow_ms=app.config['IO_PROBE_SLOW_MS'],
+    max_size_mb=app.config['IO_BENCH_MAX_MB']
+)
+io_rates = IORateSampler(interval=app.config['IO_RATES_INTERVAL_SECONDS'])
+thread_profiler = ThreadProfiler()
+
 # ========== HTML TEMPLATE ==========
+# Dashboard styles are served separately so they can be precompressed once
+# and cached by the browser instead of being resent with every page view
+DASHBOARD_CSS = '''
+body { 
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
+    max-width: 900px; 
+    margin: 40px auto; 
+    padding: 20px;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: #333;
+}
+.container { 
+    background: white; 
+    border-radius: 15px; 
+    padding: 30px; 
+    box-shadow: 0 20px 40px rgba(0,0,0,0.1);
+}
+h1 { color: #4a5568; border-bottom: 3px solid #667eea; padding-bottom: 10px; }
+.info-box { 
+    background: #f8f9fa; 
+    padding: 20px; 
+    margin: 15px 0; 
+    border-left: 5px solid #48bb78;
+    border-radius: 8px;
+}
+.status { 
+    display: inline-block; 
+    padding: 8px 15px; 
+    border-radius: 20px; 
+    font-weight: bold;
+    margin: 5px 0;
+}
+.healthy { background: #c6f6d5; color: #22543d; }
+.unhealthy { background: #fed7d7; color: #742a2a; }
+.endpoint-list { 
+    list-style: none; 
+    padding: 0; 
+}
+.endpoint-list li { 
+    margin: 8px 0; 
+    padding: 10px; 
+    background: #e2e8f0; 
+    border-radius: 5px;
+}
+.endpoint-list a { 
+    color: #2d3748; 
+    text-decoration: none; 
+    font-weight: 500;
+}
+.endpoint-list a:hover { 
+    color: #667eea; 
+    text-decoration: underline;
+}
+.badge {
+    display: inline-block;
+    padding: 3px 8px;
+    background: #e2e8f0;
+    border-radius: 12px;
+    font-size: 0.9em;
+    margin-left: 10px;
+}
+'''
+
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
 <html>
 <head>
     <title>ReproLab - {{ title }}</title>
-    <style>
-        body { 
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
-            max-width: 900px; 
-            margin: 40px auto; 
-            padding: 20px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: #333;
-        }
-        .container { 
-            background: white; 
-            border-radius: 15px; 
-            padding: 30px; 
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-        }
-        h1 { color: #4a5568; border-bottom: 3px solid #667eea; padding-bottom: 10px; }
-        .info-box { 
-            background: #f8f9fa; 
-            padding: 20px; 
-            margin: 15px 0; 
-            border-left: 5px solid #48bb78;
-            border-radius: 8px;
-        }
-        .status { 
-            display: inline-block; 
-            padding: 8px 15px; 
-            border-radius: 20px; 
-            font-weight: bold;
-            margin: 5px 0;
-        }
-        .healthy { background: #c6f6d5; color: #22543d; }
-        .unhealthy { background: #fed7d7; color: #742a2a; }
-        .endpoint-list { 
-            list-style: none; 
-            padding: 0; 
-        }
-        .endpoint-list li { 
-            margin: 8px 0; 
-            padding: 10px; 
-            background: #e2e8f0; 
-            border-radius: 5px;
-        }
-        .endpoint-list a { 
-            color: #2d3748; 
-            text-decoration: none; 
-            font-weight: 500;
-        }
-        .endpoint-list a:hover { 
-            color: #667eea; 
-            text-decoration: underline;
-        }
-        .badge {
-            display: inline-block;
-            padding: 3px 8px;
-            background: #e2e8f0;
-            border-radius: 12px;
-            font-size: 0.9em;
-            margin-left: 10px;
-        }
-    </style>
+    <link rel="stylesheet" href="/assets/dashboard.css">
 </head>
 <body>
     <div class="container">
@@ -114,13 +163,30 @@ HTML_TEMPLATE = '''
             <p><strong>Uptime:</strong> {{ uptime }} seconds</p>
         </div>
         
+        <div class="info-box">
+            <h3>📈 I/O Rates (last minute)</h3>
+            {% if io %}
+            <p><strong>Network:</strong> {{ ((io.network.bytes_recv or 0) / 1024) | round(1) }} KB/s in / {{ ((io.network.bytes_sent or 0) / 1024) | round(1) }} KB/s out</p>
+            <p><strong>Disk:</strong> {{ ((io.disk.read_bytes or 0) / 1024) | round(1) }} KB/s read / {{ ((io.disk.write_bytes or 0) / 1024) | round(1) }} KB/s write</p>
+            <p><strong>Process CPU:</strong> {{ io.cpu.process_percent }}% of one core
+                {% if io.cpu.throttled_percent is not none %}<span class="badge">throttled {{ io.cpu.throttled_percent }}%</span>{% endif %}
+            </p>
+            <p><small>Measured over {{ io.span_seconds }} s; see /info for 10 s and 5 m windows</small></p>
+            {% else %}
+            <p><small>Collecting samples&hellip;</small></p>
+            {% endif %}
+        </div>
+        
         <div class="info-box">
             <h3>🔗 Available Endpoints</h3>
             <ul class="endpoint-list">
                 <li><a href="/health">/health</a> - Docker health check endpoint</li>
                 <li><a href="/info">/info</a> - Detailed system & container information</li>
                 <li><a href="/stress">/stress</a> - CPU stress test (resource limits demo)</li>
+                <li><a href="/stress/io">/stress/io</a> - Disk I/O benchmark (throughput, fsync, mmap)</li>
                 <li><a href="/deployment">/deployment</a> - Deployment status & history</li>
+                <li><a href="/memory">/memory</a> - Per-worker memory budget & recycle events</li>
+                <li><a href="/debug/threads">/debug/threads</a> - Per-thread CPU usage & hot-thread stacks</li>
                 <li><a href="/">/</a> - This dashboard</li>
             </ul>
         </div>
@@ -132,13 +198,16 @@ HTML_TEMPLATE = '''
                 <span class="status healthy">✅ Tests Passing</span>
             </p>
             <p><strong>Deployment Model:</strong> Pull-Based (Lab → GitHub)</p>
-            <p><small>Lab machine automatically pulls changes every 5 minutes</small></p>
+            <p><small>Deployment watcher polls for changes with adaptive backoff and reloads workers in place</small></p>
         </div>
     </div>
 </body>
 </html>
 '''
 
+# Compressed once at import time; requests only pick the matching variant
+DASHBOARD_CSS_ASSET = compression.precompress(DASHBOARD_CSS, 'text/css')
+
 # ========== ROUTES ==========
 
 @app.route('/')
@@ -160,9 +229,28 @@ def index():
         memory_percent=psutil.virtual_memory().percent,
         uptime=int(time.time() - process.create_time()),
         healthy=True,
+        io=io_rates.snapshot()["windows"]["1m"],
         last_commit=os.getenv('GIT_COMMIT', '')[:8] if os.getenv('GIT_COMMIT') else None
     )
 
+@app.route('/assets/dashboard.css')
+def dashboard_css():
+    """Precompressed dashboard stylesheet with ETag revalidation"""
+    asset = DASHBOARD_CSS_ASSET
+    encoding, body = asset.select(request.headers.get('Accept-Encoding'))
+    headers = {
+        "ETag": f'"{asset.etag(encoding)}"',
+        "Cache-Control": "public, max-age=3600",
+        "Vary": "Accept-Encoding"
+    }
+    # A cache may revalidate with the tag of any encoding it holds
+    if any(request.if_none_match.contains(etag) for etag in asset.etags):
+        return Response(status=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype=asset.mimetype, headers=headers)
+
 @app.route('/health')
 def health_check():
     """
@@ -170,20 +258,25 @@ def health_check():
     Returns 200 OK if healthy, 503 if unhealthy
     """
     try:
-        # Check 1: Disk I/O
-        test_file = '/tmp/health_check.txt'
-        with open(test_file, 'w') as f:
-            f.write(f'health_check_{datetime.now().isoformat()}')
-        with open(test_file, 'r') as f:
-            content = f.read()
+        # Check 1: Disk I/O (latest scheduled write/fsync/read latency check)
+        disk_io = io_probe.health()
+        if disk_io["status"] == "fail":
+            return jsonify({
+                "status": "unhealthy",
+                "message": "Disk I/O probe failed",
+                "disk_io": disk_io,
+                "timestamp": datetime.now().isoformat()
+            }), 503
         
         # Check 2: Memory availability
-        memory = psutil.virtual_memory()
-        if memory.percent > 90:  # Critical memory usage
+        # Prefer the container (cgroup) limit; virtual_memory() reports the host
+        container = container_memory()
+        memory_percent = container["percent"] if container else psutil.virtual_memory().percent
+        if memory_percent > 90:  # Critical memory usage
             return jsonify({
                 "status": "unhealthy",
                 "message": "High memory usage",
-                "memory_percent": memory.percent,
+                "memory_percent": memory_percent,
                 "timestamp": datetime.now().isoformat()
             }), 503
         
@@ -199,12 +292,14 @@ def health_check():
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
             "service": "reprolab_flask_app",
+            "code_fingerprint": CODE_FINGERPRINT,
             "checks": {
-                "disk_io": "pass",
-                "memory": f"pass ({memory.percent}% used)",
+                "disk_io": f"{disk_io['status']} (fsync {disk_io['fsync_ms']} ms)",
+                "memory": f"pass ({memory_percent}% used)",
                 "application": "running",
                 "container": "dockerized"
             },
+            "disk_io": disk_io,
             "container_info": {
                 "user": f"uid:{os.getuid()},gid:{os.getgid()}",
                 "is_root": os.getuid() == 0,
@@ -251,7 +346,9 @@ def system_info():
             "deployment_model": "pull_based",
             "description": "Lab machine pulls from GitHub periodically",
             "last_commit_hash": os.getenv('GIT_COMMIT', '')[:8] if os.getenv('GIT_COMMIT') else None
-        }
+        },
+        "io": io_rates.snapshot(),
+        "compression": compression.stats()
     })
 
 @app.route('/stress')
@@ -289,15 +386,86 @@ def cpu_stress():
         "note": "In production, this endpoint would be protected or removed"
     })
 
+@app.route('/stress/io')
+def io_stress():
+    """
+    On-demand disk I/O benchmark: sequential/random throughput, fsync
+    latency and mmap reads with latency percentiles per block size.
+    Query params: size_mb (file size), block_kb (comma-separated sizes)
+    """
+    try:
+        size_mb = int(request.args.get('size_mb', '8'))
+        block_sizes = [
+            int(kb) * 1024
+            for kb in request.args.get('block_kb', '4,64,1024').split(',')
+            if kb.strip()
+        ]
+    except ValueError:
+        return jsonify({"error": "size_mb and block_kb must be integers"}), 400
+    if not block_sizes or any(b <= 0 for b in block_sizes):
+        return jsonify({"error": "block_kb must list positive sizes"}), 400
+    # Each block is allocated in memory; keep it within the benchmark cap
+    max_block_kb = app.config['IO_BENCH_MAX_MB'] * 1024
+    if any(b > max_block_kb * 1024 for b in block_sizes):
+        return jsonify({"error": f"block_kb must not exceed {max_block_kb}"}), 400
+
+    start_time = time.time()
+    results = io_probe.benchmark(size_mb=size_mb, block_sizes=block_sizes)
+    if results is None:
+        return jsonify({
+            "error": "An I/O benchmark is already running in this worker",
+            "worker_pid": os.getpid()
+        }), 429
+
+    return jsonify({
+        "test": "io_stress_test",
+        "purpose": "Measure disk throughput and latency inside the container",
+        "worker_pid": os.getpid(),
+        "results": results,
+        "computation_time_seconds": round(time.time() - start_time, 4),
+        "note": "Reads drop the page cache first where posix_fadvise is available"
+    })
+
+@app.route('/memory')
+def memory_info():
+    """Per-worker memory usage, budget settings and recycle events"""
+    return jsonify(memory_budget.report())
+
+@app.route('/debug/threads')
+def debug_threads():
+    """
+    Per-thread CPU usage with the hottest threads' Python stacks.
+    Query params: interval (seconds, used when there is no recent sample),
+    top (stacks to include), depth (frames per stack)
+    """
+    try:
+        interval = min(2.0, max(0.05, float(request.args.get('interval', '0.2'))))
+        top = min(20, max(0, int(request.args.get('top', '3'))))
+        depth = min(100, max(1, int(request.args.get('depth', '20'))))
+    except ValueError:
+        return jsonify({"error": "interval, top and depth must be numbers"}), 400
+
+    return jsonify(thread_profiler.snapshot(interval=interval, top=top, stack_depth=depth))
+
 @app.route('/deployment')
 def deployment_info():
     """Shows deployment information and status"""
+    watcher = read_state(app.config['DEPLOY_STATE_FILE'])
     return jsonify({
         "deployment": {
             "method": "pull_based_ci_cd",
-            "trigger": "periodic_pull_from_lab_machine",
-            "interval_minutes": 5,
+            "trigger": "conditional_poll_with_in_place_reload",
             "last_deployment": app.config['DEPLOYMENT_TIME'],
+            "watcher": {
+                "running": watcher_running(watcher),
+                "source": watcher.get("source"),
+                "version": watcher.get("version"),
+                "last_poll": watcher.get("last_poll"),
+                "next_poll_seconds": watcher.get("next_poll_seconds"),
+                "last_error": watcher.get("last_error"),
+                "last_deployment": watcher.get("last_deployment"),
+                "history": watcher.get("history", [])
+            },
             "health_status": "healthy",
             "monitoring": {
                 "health_endpoint": "/health",
@@ -313,7 +481,8 @@ def deployment_info():
         },
         "version_control": {
             "git_commit": os.getenv('GIT_COMMIT', 'unknown')[:8] if os.getenv('GIT_COMMIT') else 'unknown',
-            "git_branch": os.getenv('GIT_BRANCH', 'main')
+            "git_branch": os.getenv('GIT_BRANCH', 'main'),
+            "code_fingerprint": CODE_FINGERPRINT
         }
     })
 
@@ -0,0 +1,194 @@
+"""
+Response compression for ReproLab
+Negotiates Content-Encoding from the client's Accept-Encoding header
+(gzip always, brotli/zstd when the optional packages are installed).
+Dynamic responses are compressed per request; content that never changes
+is precompressed once (PrecompressedAsset) and served as-is.
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard  # Optional: pip install zstandard
+except ImportError:
+    zstandard = None
+
+# Server preference order when the client accepts several encodings equally
+PREFERRED_ENCODINGS = ('br', 'zstd', 'gzip')
+
+DEFAULT_MIMETYPES = (
+    'text/html',
+    'text/css',
+    'text/plain',
+    'application/json',
+    'application/javascript',
+)
+
+
+def available_encodings():
+    """Encodings this process can produce, in server preference order"""
+    encodings = []
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    encodings.append('gzip')
+    return encodings
+
+
+def parse_accept_encoding(header):
+    """Parse an Accept-Encoding header into {coding: qvalue}"""
+    accepted = {}
+    for item in (header or '').split(','):
+        parts = [p.strip() for p in item.split(';')]
+        coding = parts[0].lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def negotiate_encoding(header, encodings=None):
+    """
+    Pick the best encoding the client accepts, or None for identity.
+    Highest q-value wins; ties are broken by server preference.
+    """
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in encodings or available_encodings():
+        quality = accepted.get(coding, wildcard)
+        if quality > best_q:
+            best, best_q = coding, quality
+    return best
+
+
+def compress(data, encoding, level):
+    """Compress bytes with the given encoding at a 1-9 style level"""
+    if encoding == 'gzip':
+        # mtime=0 keeps output deterministic for precompressed assets
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        # Brotli quality runs 0-11; map the shared 1-9 level onto it
+        return brotli.compress(data, quality=min(11, round(level * 11 / 9)))
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class PrecompressedAsset:
+    """Static content compressed once, up front, in every available encoding"""
+
+    def __init__(self, body, mimetype, level=9):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.mimetype = mimetype
+        self.digest = hashlib.sha1(self.body).hexdigest()[:16]
+        self.variants = {
+            encoding: compress(self.body, encoding, level)
+            for encoding in available_encodings()
+        }
+
+    def etag(self, encoding=None):
+        """
+        Strong ETag for one representation. Each encoding is a different
+        byte sequence, so it gets its own tag ("<digest>-gzip" etc.)
+        """
+        return f"{self.digest}-{encoding}" if encoding else self.digest
+
+    @property
+    def etags(self):
+        """ETags of every representation, for If-None-Match matching"""
+        return [self.etag()] + [self.etag(encoding) for encoding in self.variants]
+
+    def select(self, accept_encoding):
+        """Return (encoding, body) for the client, encoding None for identity"""
+        encoding = negotiate_encoding(accept_encoding, list(self.variants))
+        if encoding is None:
+            return None, self.body
+        return encoding, self.variants[encoding]
+
+
+class Compression:
+    """
+    Flask extension that compresses eligible responses in after_request.
+
+    Config keys (read in init_app):
+      COMPRESS_LEVEL       compression level, 1 (fast) - 9 (small)
+      COMPRESS_MIN_SIZE    bodies smaller than this many bytes are sent as-is
+      COMPRESS_MIMETYPES   content types eligible for compression
+    """
+
+    def __init__(self, app=None):
+        self.level = 6
+        self.min_size = 500
+        self.mimetypes = set(DEFAULT_MIMETYPES)
+        self.compressed = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+
+        self.level = max(1, min(9, int(app.config['COMPRESS_LEVEL'])))
+        self.min_size = int(app.config['COMPRESS_MIN_SIZE'])
+        self.mimetypes = set(app.config['COMPRESS_MIMETYPES'])
+
+        app.extensions['compression'] = self
+        app.after_request(self.after_request)
+
+    def precompress(self, body, mimetype):
+        """Build a PrecompressedAsset for content that never changes"""
+        return PrecompressedAsset(body, mimetype, level=9)
+
+    def _eligible(self, response):
+        if response.direct_passthrough or response.is_streamed:
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        return response.mimetype in self.mimetypes
+
+    def after_request(self, response):
+        from flask import request
+
+        if not self._eligible(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        # Dynamic bodies (CPU %, uptime, ...) rarely repeat, so caching them
+        # would only add hashing and evictions; static content uses precompress
+        response.set_data(compress(data, encoding, self.level))
+        self.compressed += 1
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def stats(self):
+        return {
+            "encodings": available_encodings(),
+            "level": self.level,
+            "min_size_bytes": self.min_size,
+            "responses_compressed": self.compressed
+        }
@@ -0,0 +1,729 @@
+#!/usr/bin/env python3
+"""
+ReproLab deployment watcher
+Pull-based deployment without cold restarts: polls a commit source with
+conditional requests (ETag / digest comparison) and adaptive backoff, and
+on a change updates the code on disk and reloads gunicorn in place -- a new
+master and workers are started from the updated code, checked for
+readiness (including serving the new code fingerprint), and only then is
+the old master drained. The measured cutover time of every deployment is kept
+in a state file that the app's /deployment endpoint reports.
+
+A deploy that fails for a transient reason (health unreachable, workers
+not ready) is retried with backoff, up to DEPLOY_MAX_ATTEMPTS times; a
+release whose update fails or changes no code is skipped until the source
+moves on. On the first poll the source's release is rolled out unless the
+running code already matches it.
+
+Registry image sources are rejected: a new image only reaches a running
+container by replacing the container, never by reloading it in place.
+
+In the container the entrypoint is `deploy_watcher.py supervise`: a
+supervisor that stays the main process across reloads (the new master is
+re-parented to it when the old one exits), starts gunicorn and, when
+DEPLOY_SOURCE is set, this watcher. Code updates reach the container
+through the ./:/app mount. A gunicorn master that is itself the
+container's main process (or the only child of tini) is never reloaded:
+retiring it would stop the container, and the new master with it.
+
+Sources (DEPLOY_SOURCE):
+  /path/to/file                 local file holding the current version
+  http(s)://...                 any URL polled with ETag / If-None-Match
+  git:<remote>#<ref>            commit of a ref via `git ls-remote`
+
+Run with:  python deploy_watcher.py
+           python deploy_watcher.py supervise gunicorn -c gunicorn.conf.py app:app
+"""
+import ctypes
+import hashlib
+import json
+import os
+import random
+import shlex
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+import psutil
+
+DEFAULT_STATE_FILE = '/tmp/reprolab-deploy.json'
+DEFAULT_PIDFILE = '/tmp/reprolab-gunicorn.pid'
+UPDATE_TIMEOUT = 300
+# Slack on the watcher's heartbeat deadline before it is reported stopped
+HEARTBEAT_GRACE_SECONDS = 30
+
+
+class DeployError(Exception):
+    """A deployment step failed; the running version is left in place"""
+
+
+class ReleaseError(DeployError):
+    """
+    The release itself cannot be deployed (its update fails, or it does not
+    change the code); retrying the same release would fail the same way
+    """
+
+
+# ========== SOURCES ==========
+# check(etag) returns (changed, version, etag). `changed` is False when
+# the source confirms the caller's etag is still current.
+
+class FileSource:
+    """Local file whose content is the deployed version (testing stand-in)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = f"file:{path}"
+
+    def check(self, etag=None):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            raise DeployError(f"Version file not found: {self.path}")
+        # Cheap conditional check on size/mtime before reading the content
+        stat_tag = f"{stat.st_size}-{stat.st_mtime_ns}"
+        if etag and etag.split('/')[0] == stat_tag:
+            return False, None, etag
+
+        with open(self.path, 'r') as f:
+            version = f.read().strip()
+        digest = hashlib.sha256(version.encode('utf-8')).hexdigest()[:16]
+        new_etag = f"{stat_tag}/{digest}"
+        # Touched but unchanged content is not a new version
+        if etag and etag.split('/')[-1] == digest:
+            return False, version, new_etag
+        return True, version, new_etag
+
+
+IMAGE_SOURCE_ERROR = ("Registry image sources cannot be deployed by an in-place "
+                      "reload; replace the container to roll out a new image")
+
+
+def is_registry_manifest_url(url):
+    """True for registry API manifest URLs (.../v2/<name>/manifests/<ref>)"""
+    return '/v2/' in url and '/manifests/' in url
+
+
+class HTTPSource:
+    """
+    HTTP endpoint polled with If-None-Match, e.g. the GitHub commits API,
+    whose 304 responses do not count against the rate limit.
+    """
+
+    def __init__(self, url, token=None, timeout=10):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.name = url
+
+    def check(self, etag=None):
+        headers = {"Accept": "application/json, */*;q=0.8"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if etag:
+            headers["If-None-Match"] = etag
+        request = urllib.request.Request(self.url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+                is_image = 'Docker-Content-Digest' in response.headers
+                new_etag = response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return False, None, etag
+            raise DeployError(f"{self.url} returned HTTP {e.code}")
+        except (urllib.error.URLError, OSError) as e:
+            raise DeployError(f"{self.url} unreachable: {e}")
+
+        if is_image:
+            raise DeployError(IMAGE_SOURCE_ERROR)
+        version = _version_from_body(body)
+        new_etag = new_etag or f'"{version}"'
+        # Servers without ETag support still answer 200; compare versions
+        if etag and etag == new_etag:
+            return False, version, new_etag
+        return True, version, new_etag
+
+
+class GitSource:
+    """Commit a remote ref points at, via `git ls-remote` (no clone needed)"""
+
+    def __init__(self, remote, ref='refs/heads/main', timeout=30):
+        self.remote = remote
+        self.ref = ref
+        self.timeout = timeout
+        self.name = f"git:{remote}#{ref}"
+
+    def check(self, etag=None):
+        try:
+            output = subprocess.run(
+                ['git', 'ls-remote', self.remote, self.ref],
+                capture_output=True, text=True, timeout=self.timeout, check=True
+            ).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            raise DeployError(f"git ls-remote failed: {e}")
+        if not output.strip():
+            raise DeployError(f"Ref not found: {self.ref}")
+        commit = output.split()[0]
+        return commit != etag, commit, commit
+
+
+def _version_from_body(body):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        for key in ('sha', 'digest', 'version', 'commit'):
+            if isinstance(data.get(key), str):
+                return data[key]
+    text = body.decode('utf-8', 'replace').strip()
+    if text and len(text) <= 128 and '\n' not in text:
+        return text
+    return f"sha256:{hashlib.sha256(body).hexdigest()}"
+
+
+def source_from_spec(spec, token=None):
+    """Build a source from a DEPLOY_SOURCE value"""
+    if spec.startswith(('http://', 'https://')):
+        if is_registry_manifest_url(spec):
+            raise DeployError(IMAGE_SOURCE_ERROR)
+        return HTTPSource(spec, token=token)
+    if spec.startswith('git:'):
+        remote, _, ref = spec[len('git:'):].partition('#')
+        return GitSource(remote, ref or 'refs/heads/main')
+    return FileSource(spec)
+
+
+def code_fingerprint(directory):
+    """
+    Short digest of every .py file under `directory`. The app reports the
+    fingerprint it was imported with, so the watcher can tell whether an
+    update changed the code and whether the new workers are running it.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__pycache__')))
+        for name in sorted(files):
+            if not name.endswith('.py'):
+                continue
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, directory).encode('utf-8'))
+            try:
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            except OSError:
+                continue
+    return digest.hexdigest()[:16]
+
+
+# ========== BACKOFF ==========
+
+class Backoff:
+    """
+    Adaptive poll interval: reset to the minimum after a change (updates
+    often come in bursts), grow by `factor` while nothing changes or the
+    source is failing, capped at the maximum. Jitter keeps several lab
+    machines from polling in lockstep.
+    """
+
+    def __init__(self, min_interval=30, max_interval=600, factor=1.5, jitter=0.1):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.current = min_interval
+
+    def next(self, changed):
+        if changed:
+            self.current = self.min_interval
+        else:
+            self.current = min(self.max_interval, self.current * self.factor)
+        spread = self.current * self.jitter
+        return max(1.0, self.current + random.uniform(-spread, spread))
+
+
+# ========== RELOAD ==========
+
+CONTAINER_INITS = ('docker-init', 'tini', 'dumb-init')
+
+
+def stops_container(master):
+    """
+    True when retiring this gunicorn master would stop its container:
+    either it is PID 1 itself, or its parent is a container init (tini
+    and friends exit as soon as their single child exits).
+    """
+    if master.pid == 1:
+        return True
+    try:
+        parent = master.parent()
+        return parent is not None and parent.pid == 1 and parent.name() in CONTAINER_INITS
+    except psutil.Error:
+        return False
+
+
+class GunicornReloader:
+    """
+    Zero-downtime reload of a gunicorn master found via its pidfile.
+
+    USR2 makes the old master re-exec a new master (which re-imports the
+    app) sharing the same listening socket. Once the new master has its
+    workers up and the health URL answers, the old master gets TERM and
+    drains its in-flight requests. If the new master never becomes ready it
+    is stopped and the old one keeps serving.
+    """
+
+    def __init__(self, pidfile=DEFAULT_PIDFILE, health_url=None,
+                 ready_timeout=60, drain_timeout=60, poll=0.2):
+        self.pidfile = pidfile
+        self.health_url = health_url
+        self.ready_timeout = ready_timeout
+        self.drain_timeout = drain_timeout
+        self.poll = poll
+
+    def _read_pid(self, path=None):
+        try:
+            with open(path or self.pidfile, 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _new_master_pid(self, old_pid):
+        # The re-exec'd master writes "<pidfile>.2" and renames it to the
+        # pidfile once the old master is gone
+        for path in (f"{self.pidfile}.2", self.pidfile):
+            pid = self._read_pid(path)
+            if pid not in (None, old_pid):
+                return pid
+        return None
+
+    def _health(self):
+        """Health JSON from the serving app, None when it does not answer 200"""
+        try:
+            with urllib.request.urlopen(self.health_url, timeout=2) as response:
+                if response.status != 200:
+                    return None
+                return json.loads(response.read())
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def running_fingerprint(self):
+        """Code fingerprint the currently serving workers were started with"""
+        health = self._health() if self.health_url else None
+        return health.get("code_fingerprint") if health else None
+
+    def _healthy(self, expected_fingerprint=None):
+        if not self.health_url:
+            return True
+        health = self._health()
+        if health is None:
+            return False
+        # Both masters share the socket; only a reply carrying the new
+        # fingerprint proves a new worker is serving the updated code
+        return expected_fingerprint is None \
+            or health.get("code_fingerprint") == expected_fingerprint
+
+    def _wait(self, condition, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(self.poll)
+        return False
+
+    def _current_master_pid(self):
+        # Right after a cutover the new master has only "<pidfile>.2" until
+        # it notices the old master is gone and promotes itself
+        return self._read_pid() or self._read_pid(f"{self.pidfile}.2")
+
+    def reload(self, expected_fingerprint=None):
+        # Until the old master exits, the pidfile still names it and the
+        # serving master only has "<pidfile>.2"; reloading then would signal
+        # the draining master and take the serving one for the new master
+        pids = {self._read_pid(), self._read_pid(f"{self.pidfile}.2")}
+        if len({pid for pid in pids if pid is not None and psutil.pid_exists(pid)}) > 1:
+            raise DeployError("A previous reload is still draining its old master")
+        old_pid = self._current_master_pid()
+        if old_pid is None or not psutil.pid_exists(old_pid):
+            raise DeployError(f"No running gunicorn master in {self.pidfile}")
+        old_master = psutil.Process(old_pid)
+        if stops_container(old_master):
+            raise DeployError("In-place reload would stop the container (gunicorn is its "
+                              "main process); start it under `deploy_watcher.py supervise`")
+        expected_workers = max(1, len(old_master.children()))
+
+        start = time.monotonic()
+        os.kill(old_pid, signal.SIGUSR2)
+
+        if not self._wait(lambda: self._new_master_pid(old_pid), self.ready_timeout):
+            raise DeployError("New gunicorn master did not start")
+        new_pid = self._new_master_pid(old_pid)
+        new_master = psutil.Process(new_pid)
+
+        def ready():
+            try:
+                workers = len(new_master.children())
+            except psutil.NoSuchProcess:
+                raise DeployError("New gunicorn master exited during startup")
+            return workers >= expected_workers and self._healthy(expected_fingerprint)
+
+        remaining = self.ready_timeout - (time.monotonic() - start)
+        if not self._wait(ready, max(0, remaining)):
+            # Roll back: keep the old master serving
+            try:
+                new_master.terminate()
+            except psutil.NoSuchProcess:
+                pass
+            raise DeployError("New workers did not become ready; kept old version")
+        ready_seconds = time.monotonic() - start
+
+        # New workers are serving; gracefully drain the old master
+        os.kill(old_pid, signal.SIGTERM)
+
+        def exited():
+            try:
+                return not old_master.is_running() \
+                    or old_master.status() == psutil.STATUS_ZOMBIE
+            except psutil.NoSuchProcess:
+                # Reaped between the two checks: it has drained
+                return True
+
+        drained = self._wait(exited, self.drain_timeout)
+        cutover_seconds = time.monotonic() - start
+
+        return {
+            "old_master_pid": old_pid,
+            "new_master_pid": new_pid,
+            "workers": expected_workers,
+            "ready_seconds": round(ready_seconds, 3),
+            "drain_seconds": round(cutover_seconds - ready_seconds, 3),
+            "cutover_seconds": round(cutover_seconds, 3),
+            "old_master_drained": drained
+        }
+
+
+# ========== SUPERVISOR ==========
+
+PR_SET_CHILD_SUBREAPER = 36
+
+
+def become_subreaper():
+    """
+    Make orphaned descendants re-parent to this process instead of PID 1
+    (Linux only); returns False where that is not supported
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+class Supervisor:
+    """
+    Container main process that outlives in-place reloads.
+
+    Starts gunicorn (and the watcher when DEPLOY_SOURCE is set), reaps
+    every child, and forwards stop/reload signals to the gunicorn masters.
+    On USR2 the new master is a child of the old one; when the old master
+    drains and exits, the new master is re-parented here, so the container
+    keeps running. The supervisor exits, with gunicorn's exit code, once
+    no gunicorn master is left.
+    """
+
+    FORWARDED_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT, signal.SIGHUP)
+
+    def __init__(self, command, pidfile=DEFAULT_PIDFILE, watch=False):
+        self.command = command
+        self.pidfile = pidfile
+        self.watch = watch
+        self.watcher_pid = None
+
+    def _gunicorn_children(self):
+        """
+        Children other than the watcher: the gunicorn master(s), plus any
+        workers a killed master left behind until they notice and exit
+        """
+        return [child.pid for child in psutil.Process().children()
+                if child.pid != self.watcher_pid]
+
+    def _pidfile_masters(self):
+        pids = set()
+        for path in (self.pidfile, f"{self.pidfile}.2"):
+            try:
+                with open(path, 'r') as f:
+                    pids.add(int(f.read().strip()))
+            except (OSError, ValueError):
+                continue
+        return pids
+
+    def _forward(self, signum, _frame):
+        # A master started by USR2 is not our child until the old one exits
+        targets = set(self._gunicorn_children()) | self._pidfile_masters()
+        if signum != signal.SIGHUP and self.watcher_pid:
+            targets.add(self.watcher_pid)
+        for pid in targets:
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
+    def run(self):
+        become_subreaper()
+        for signum in self.FORWARDED_SIGNALS:
+            signal.signal(signum, self._forward)
+        masters = {subprocess.Popen(self.command).pid}
+        if self.watch:
+            self.watcher_pid = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__)]).pid
+
+        exit_code = 0
+        while True:
+            masters |= self._pidfile_masters()
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            if pid == self.watcher_pid:
+                self.watcher_pid = None
+                continue
+            if pid in masters:
+                # Not the workers a killed master leaves behind
+                exit_code = os.waitstatus_to_exitcode(status)
+                if exit_code < 0:
+                    exit_code = 128 - exit_code  # killed by a signal, as in a shell
+            if not self._gunicorn_children():
+                # gunicorn stopped or crashed: let the container restart
+                break
+
+        if self.watcher_pid:
+            os.kill(self.watcher_pid, signal.SIGTERM)
+            os.waitpid(self.watcher_pid, 0)
+        return exit_code
+
+
+# ========== WATCHER ==========
+
+def read_state(path=DEFAULT_STATE_FILE):
+    """Watcher state as written by DeployWatcher, or {} if none yet"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def watcher_running(state, grace=HEARTBEAT_GRACE_SECONDS):
+    """
+    True while the watcher that wrote `state` is alive: it records the
+    latest time it will write again (heartbeat_deadline), so a state file
+    left behind by a stopped or crashed watcher goes stale
+    """
+    deadline = state.get("heartbeat_deadline")
+    return deadline is not None and time.time() <= deadline + grace
+
+
+class DeployWatcher:
+    """Poll a source and reload on change, recording every deployment"""
+
+    def __init__(self, source, reloader, backoff=None, state_file=DEFAULT_STATE_FILE,
+                 update_command=None, code_dir=None, max_history=20, max_attempts=3):
+        self.source = source
+        self.reloader = reloader
+        self.backoff = backoff or Backoff()
+        self.state_file = state_file
+        self.update_command = update_command
+        self.code_dir = code_dir or os.path.dirname(os.path.abspath(__file__))
+        self.max_history = max_history
+        self.max_attempts = max(1, max_attempts)
+        self.state = read_state(state_file)
+        self.state.setdefault("history", [])
+        self._running = True
+
+    def _save(self):
+        directory = os.path.dirname(self.state_file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def _record(self, entry):
+        self.state["history"] = ([entry] + self.state["history"])[:self.max_history]
+
+    def deploy(self, version, baseline=False):
+        """
+        Apply the update (if configured), check that it changed the code
+        the app is running, and reload; returns a history entry.
+
+        With baseline=True (no deployed version recorded yet) code that is
+        already running is not an error: nothing is reloaded and None is
+        returned.
+        """
+        entry = {
+            "version": version,
+            "previous_version": self.state.get("version"),
+            "started": datetime.now().isoformat()
+        }
+        try:
+            running = self.reloader.running_fingerprint()
+            if running is None:
+                raise DeployError("Cannot read the running code fingerprint from /health")
+            if self.update_command:
+                result = subprocess.run(shlex.split(self.update_command),
+                                        capture_output=True, text=True,
+                                        timeout=UPDATE_TIMEOUT)
+                if result.returncode != 0:
+                    raise ReleaseError(f"Update command failed: {result.stderr.strip()[-500:]}")
+            fingerprint = code_fingerprint(self.code_dir)
+            if fingerprint == running:
+                if baseline:
+                    return None
+                # Reloading would re-import the same code and report a
+                # version that is not actually running
+                raise ReleaseError(f"Code in {self.code_dir} is unchanged after the update "
+                                  "step; nothing new to reload")
+            entry["code_fingerprint"] = fingerprint
+            entry.update(self.reloader.reload(expected_fingerprint=fingerprint))
+            entry["status"] = "success"
+        except ReleaseError as e:
+            entry.update(status="failed", error=str(e), retryable=False)
+        except (DeployError, OSError, psutil.Error, subprocess.SubprocessError) as e:
+            # Health unreachable, workers not ready, no master, ...: the
+            # release may well deploy on a later attempt
+            entry.update(status="failed", error=str(e), retryable=True)
+        entry["finished"] = datetime.now().isoformat()
+        return entry
+
+    def poll_once(self):
+        """One conditional poll; returns seconds to wait before the next"""
+        self.state["last_poll"] = datetime.now().isoformat()
+        self.state["source"] = self.source.name
+        # After a failed deploy, compare against the failed release so it is
+        # skipped until the source moves on, instead of retried every poll
+        failed = self.state.get("failed_etag") is not None
+        etag_key = "failed_etag" if failed else "etag"
+        try:
+            changed, version, etag = self.source.check(self.state.get(etag_key))
+        except DeployError as e:
+            self.state["last_error"] = str(e)
+            interval = self.backoff.next(changed=False)
+        else:
+            self.state["last_error"] = None
+            if changed:
+                # A deploy can outlast the poll interval; keep the heartbeat
+                # valid for the longest it may take
+                self.state["heartbeat_deadline"] = time.time() + UPDATE_TIMEOUT \
+                    + self.reloader.ready_timeout + self.reloader.drain_timeout
+                self._save()
+                # Without a recorded version (first poll, lost state file)
+                # the source may be ahead of the running code: update, and
+                # only take it as the baseline if that changed nothing
+                baseline = self.state.get("etag") is None
+                entry = self.deploy(version, baseline=baseline)
+                if entry is None:
+                    self.state.update(version=version, etag=etag, retry=None)
+                    changed = False
+                elif baseline and entry["status"] == "failed" and entry["retryable"]:
+                    # e.g. gunicorn still starting next to the watcher; no
+                    # deployment to record yet, check again on the next poll
+                    self.state["last_error"] = entry["error"]
+                    changed = False
+                else:
+                    changed = self._finish_deploy(entry, version, etag)
+            elif etag:
+                self.state[etag_key] = etag
+            interval = self.backoff.next(changed)
+
+        self.state["next_poll_seconds"] = round(interval, 1)
+        self.state["heartbeat_deadline"] = time.time() + interval
+        self._save()
+        return interval
+
+    def _finish_deploy(self, entry, version, etag):
+        """Record a deploy; returns False when polling should back off"""
+        self._record(entry)
+        self.state["last_deployment"] = entry
+        if entry["status"] == "success":
+            self.state.update(version=version, etag=etag, retry=None,
+                              failed_version=None, failed_etag=None)
+            return True
+
+        retry = self.state.get("retry") or {}
+        attempts = retry.get("attempts", 0) + 1 if retry.get("version") == version else 1
+        if entry["retryable"] and attempts < self.max_attempts:
+            # etag stays at the running release, so the next poll sees the
+            # change again and retries it
+            self.state["retry"] = {"version": version, "attempts": attempts}
+        else:
+            # Skip this release until the source moves on
+            self.state.update(failed_version=version, failed_etag=etag, retry=None)
+        # Back off rather than polling (and failing) at full rate
+        return False
+
+    def stop(self, *_):
+        self._running = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        while self._running:
+            interval = self.poll_once()
+            deadline = time.monotonic() + interval
+            while self._running and time.monotonic() < deadline:
+                time.sleep(min(1.0, deadline - time.monotonic()))
+        # Report the watcher as stopped right away, not once the deadline passes
+        self.state["heartbeat_deadline"] = None
+        self._save()
+
+
+def watcher_from_env():
+    """Build a DeployWatcher from DEPLOY_* / GUNICORN_PIDFILE variables"""
+    spec = os.getenv('DEPLOY_SOURCE')
+    if not spec:
+        raise SystemExit("DEPLOY_SOURCE is not set")
+    try:
+        source = source_from_spec(spec, token=os.getenv('DEPLOY_SOURCE_TOKEN'))
+    except DeployError as e:
+        raise SystemExit(str(e))
+    port = os.getenv('FLASK_PORT', '5000')
+    return DeployWatcher(
+        source=source,
+        reloader=GunicornReloader(
+            pidfile=os.getenv('GUNICORN_PIDFILE', DEFAULT_PIDFILE),
+            health_url=os.getenv('DEPLOY_HEALTH_URL', f'http://127.0.0.1:{port}/health'),
+            ready_timeout=float(os.getenv('DEPLOY_READY_TIMEOUT', '60')),
+            drain_timeout=float(os.getenv('DEPLOY_DRAIN_TIMEOUT', '60'))
+        ),
+        backoff=Backoff(
+            min_interval=float(os.getenv('DEPLOY_MIN_INTERVAL', '30')),
+            max_interval=float(os.getenv('DEPLOY_MAX_INTERVAL', '600')),
+            factor=float(os.getenv('DEPLOY_BACKOFF_FACTOR', '1.5'))
+        ),
+        state_file=os.getenv('DEPLOY_STATE_FILE', DEFAULT_STATE_FILE),
+        update_command=os.getenv('DEPLOY_UPDATE_COMMAND'),
+        code_dir=os.getenv('DEPLOY_CODE_DIR'),
+        max_attempts=int(os.getenv('DEPLOY_MAX_ATTEMPTS', '3'))
+    )
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['supervise']:
+        if not sys.argv[2:]:
+            raise SystemExit("Usage: deploy_watcher.py supervise <command> [args...]")
+        sys.exit(Supervisor(
+            sys.argv[2:],
+            pidfile=os.getenv('GUNICORN_PIDFILE', DEFAULT_PIDFILE),
+            watch=bool(os.getenv('DEPLOY_SOURCE'))
+        ).run())
+
+    watcher = watcher_from_env()
+    print(f"👀 Watching {watcher.source.name} for deployments")
+    print(f"🔁 Reloading gunicorn via {watcher.reloader.pidfile}")
+    watcher.run()
+    sys.exit(0)
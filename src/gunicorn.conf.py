@@ -0,0 +1,60 @@
+"""
+Gunicorn configuration for ReproLab
+Preloads the app in the master and freezes its heap before forking so
+workers share those pages copy-on-write, then recycles each worker
+gracefully once it exceeds its memory or request budget (see
+memory_budget.py and the WORKER_* settings in app.py).
+"""
+import os
+
+from memory_budget import freeze_for_fork
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+# Sync workers (threads=1) finish every accepted connection when drained
+# during a reload; gthread workers can drop queued keep-alive connections
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '20'))
+# deploy_watcher.py finds the master here to perform USR2 reloads
+pidfile = os.getenv('GUNICORN_PIDFILE', '/tmp/reprolab-gunicorn.pid')
+
+# Import the app once in the master so workers inherit it instead of each
+# importing (and allocating) their own copy
+preload_app = True
+
+
+def when_ready(server):
+    server.log.info("Preloaded app; %d objects frozen for fork", freeze_for_fork())
+
+
+def pre_fork(server, worker):
+    # Objects created since the last fork (e.g. during respawns) are frozen
+    # too, so the collector in the child never writes to shared pages
+    freeze_for_fork()
+
+
+def post_fork(server, worker):
+    from app import io_rates, memory_budget
+    memory_budget.reset_for_worker()
+    memory_budget.sample()
+    # Sampler threads do not survive fork; start this worker's own
+    io_rates.ensure_started()
+
+
+def post_request(worker, req, environ, resp):
+    from app import memory_budget
+    reason = memory_budget.record_request()
+    if reason and worker.alive:
+        # Finish the in-flight requests, then exit; the master forks a
+        # replacement from the frozen preloaded image
+        worker.log.info("Recycling worker %s: %s", worker.pid, reason)
+        memory_budget.record_recycle(reason)
+        worker.alive = False
+
+
+def child_exit(server, worker):
+    # Runs in the master, so recycled and killed workers are both cleaned up
+    from app import io_probe, memory_budget
+    memory_budget.worker_exited(worker.pid)
+    io_probe.worker_exited(worker.pid)
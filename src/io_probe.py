@@ -0,0 +1,301 @@
+"""
+Disk I/O probe for ReproLab
+Measures real I/O behaviour instead of "can we write a file": a cheap
+write/fsync/read latency check that runs on a schedule and feeds the health
+endpoint, and an on-demand benchmark of sequential and random throughput,
+fsync latency and the mmap read path at configurable block sizes.
+
+Every worker process uses its own temp directory, so concurrent workers
+never share (or clobber) probe files. The directory is removed when the
+process exits, or by the gunicorn master (worker_exited) when a worker is
+killed before it can clean up.
+"""
+import atexit
+import glob
+import mmap
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+MB = 1024 * 1024
+DEFAULT_BLOCK_SIZES = (4 * 1024, 64 * 1024, 1024 * 1024)
+
+
+def percentiles(samples):
+    """Summarise latency samples (seconds) as milliseconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(pick(50) * 1000, 3),
+        "p90_ms": round(pick(90) * 1000, 3),
+        "p99_ms": round(pick(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def _throughput(nbytes, seconds):
+    return round(nbytes / MB / seconds, 2) if seconds > 0 else None
+
+
+def _drop_cache(fd):
+    """Ask the kernel to drop cached pages so reads hit the device"""
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+class IOProbe:
+    """
+    Per-worker disk I/O probe.
+
+    base_dir        parent directory for the per-worker temp directories
+    interval        seconds between scheduled latency checks
+    slow_ms         fsync latency above which disk I/O is reported "slow"
+    max_size_mb     upper bound on the benchmark file size
+    """
+
+    def __init__(self, base_dir=None, interval=30, slow_ms=50, max_size_mb=64):
+        self.base_dir = base_dir or tempfile.gettempdir()
+        self.interval = interval
+        self.slow_ms = slow_ms
+        self.max_size_mb = max_size_mb
+        self._pid = None
+        self._dir = None
+        self._thread = None
+        self._last_check = None
+        self._cleanup_registered = False
+        self._lock = threading.Lock()
+        self._bench_lock = threading.Lock()
+
+    # ---------- per-worker working directory ----------
+
+    def _workdir(self):
+        # Re-create after fork so each worker gets its own directory
+        if self._pid != os.getpid() or not os.path.isdir(self._dir or ''):
+            self._pid = os.getpid()
+            self._dir = tempfile.mkdtemp(
+                prefix=f'reprolab-io-{self._pid}-', dir=self.base_dir)
+            self._thread = None
+            if not self._cleanup_registered:
+                # Inherited across fork; cleanup() only removes the
+                # directory of the process that is exiting
+                atexit.register(self.cleanup)
+                self._cleanup_registered = True
+        return self._dir
+
+    def cleanup(self):
+        """Remove this worker's probe directory"""
+        if self._dir and self._pid == os.getpid():
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def worker_exited(self, pid):
+        """
+        Remove the probe directories of a worker that has exited. Called
+        from the master, so it also covers workers that were killed before
+        they could clean up after themselves.
+        """
+        for path in glob.glob(os.path.join(self.base_dir, f'reprolab-io-{pid}-*')):
+            shutil.rmtree(path, ignore_errors=True)
+
+    # ---------- cheap scheduled latency check ----------
+
+    def latency_check(self, size=4096):
+        """Write, fsync and read back one small block; returns timings in ms"""
+        path = os.path.join(self._workdir(), 'latency.bin')
+        payload = os.urandom(size)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            start = time.perf_counter()
+            os.pwrite(fd, payload, 0)
+            written = time.perf_counter()
+            os.fsync(fd)
+            synced = time.perf_counter()
+            data = os.pread(fd, size, 0)
+            done = time.perf_counter()
+        finally:
+            os.close(fd)
+
+        if data != payload:
+            raise IOError("Disk I/O probe read back different data")
+
+        fsync_ms = round((synced - written) * 1000, 3)
+        result = {
+            "status": "slow" if fsync_ms > self.slow_ms else "pass",
+            "write_ms": round((written - start) * 1000, 3),
+            "fsync_ms": fsync_ms,
+            "read_ms": round((done - synced) * 1000, 3),
+            "block_bytes": size,
+            "timestamp": datetime.now().isoformat(),
+            "checked_at": time.time()
+        }
+        with self._lock:
+            self._last_check = result
+        return result
+
+    def _run_schedule(self, pid):
+        while self._pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.latency_check()
+            except OSError as e:
+                with self._lock:
+                    self._last_check = {
+                        "status": "fail",
+                        "error": str(e),
+                        "timestamp": datetime.now().isoformat(),
+                        "checked_at": time.time()
+                    }
+
+    def ensure_scheduled(self):
+        """Start this worker's background latency checks if not running"""
+        self._workdir()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run_schedule, args=(self._pid,),
+                name='io-probe', daemon=True)
+            self._thread.start()
+
+    def health(self):
+        """
+        Latest scheduled latency check. Runs one inline when there is no
+        result yet or the last one is older than two intervals.
+        """
+        self.ensure_scheduled()
+        with self._lock:
+            last = self._last_check
+        if last is None or time.time() - last["checked_at"] > 2 * self.interval:
+            last = self.latency_check()
+        return {k: v for k, v in last.items() if k != "checked_at"}
+
+    # ---------- on-demand benchmark ----------
+
+    def benchmark(self, size_mb=8, block_sizes=DEFAULT_BLOCK_SIZES, random_ops=256):
+        """
+        Full I/O benchmark. Returns None if one is already running in this
+        worker, so concurrent requests cannot stack up disk load.
+        Raises ValueError for block sizes above max_size_mb: each block is
+        held in memory and the file grows to at least one block.
+        """
+        if any(block <= 0 or block > self.max_size_mb * MB for block in block_sizes):
+            raise ValueError(f"Block sizes must be between 1 byte and {self.max_size_mb} MB")
+        if not self._bench_lock.acquire(blocking=False):
+            return None
+        try:
+            size = max(1, min(int(size_mb), self.max_size_mb)) * MB
+            path = os.path.join(self._workdir(), 'bench.bin')
+            results = {
+                "file_size_mb": size // MB,
+                "directory": self._dir,
+                "timestamp": datetime.now().isoformat(),
+                "blocks": {}
+            }
+            try:
+                for block in block_sizes:
+                    results["blocks"][str(block)] = self._bench_block(
+                        path, size, block, random_ops)
+            finally:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return results
+        finally:
+            self._bench_lock.release()
+
+    def _bench_block(self, path, size, block, random_ops):
+        blocks = max(1, size // block)
+        size = blocks * block
+        payload = os.urandom(block)
+        result = {"block_bytes": block}
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            # Sequential write, then the fsync that makes it durable
+            latencies = []
+            start = time.perf_counter()
+            for i in range(blocks):
+                t = time.perf_counter()
+                os.pwrite(fd, payload, i * block)
+                latencies.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            os.fsync(fd)
+            fsync_seconds = time.perf_counter() - t
+            result["sequential_write"] = {
+                "mb_per_s": _throughput(size, time.perf_counter() - start),
+                "latency": percentiles(latencies)
+            }
+            result["fsync_after_write_ms"] = round(fsync_seconds * 1000, 3)
+
+            # Sequential read from a cold cache
+            _drop_cache(fd)
+            latencies = []
+            start = time.perf_counter()
+            for i in range(blocks):
+                t = time.perf_counter()
+                os.pread(fd, block, i * block)
+                latencies.append(time.perf_counter() - t)
+            result["sequential_read"] = {
+                "mb_per_s": _throughput(size, time.perf_counter() - start),
+                "latency": percentiles(latencies)
+            }
+
+            # Random read / write at block-aligned offsets
+            ops = min(random_ops, blocks)
+            offsets = [random.randrange(blocks) * block for _ in range(ops)]
+            _drop_cache(fd)
+            latencies = []
+            start = time.perf_counter()
+            for offset in offsets:
+                t = time.perf_counter()
+                os.pread(fd, block, offset)
+                latencies.append(time.perf_counter() - t)
+            result["random_read"] = {
+                "mb_per_s": _throughput(ops * block, time.perf_counter() - start),
+                "latency": percentiles(latencies)
+            }
+
+            latencies = []
+            fsyncs = []
+            start = time.perf_counter()
+            for offset in offsets:
+                t = time.perf_counter()
+                os.pwrite(fd, payload, offset)
+                latencies.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                os.fsync(fd)
+                fsyncs.append(time.perf_counter() - t)
+            result["random_write"] = {
+                "mb_per_s": _throughput(ops * block, time.perf_counter() - start),
+                "latency": percentiles(latencies)
+            }
+            result["fsync"] = percentiles(fsyncs)
+
+            # mmap read path: touch every block through the mapping
+            _drop_cache(fd)
+            latencies = []
+            start = time.perf_counter()
+            with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mapped:
+                for i in range(blocks):
+                    t = time.perf_counter()
+                    mapped[i * block:(i + 1) * block]
+                    latencies.append(time.perf_counter() - t)
+            result["mmap_read"] = {
+                "mb_per_s": _throughput(size, time.perf_counter() - start),
+                "latency": percentiles(latencies)
+            }
+        finally:
+            os.close(fd)
+        return result
@@ -0,0 +1,189 @@
+"""
+Incremental I/O rate accounting for ReproLab
+Samples cumulative counters (system network and disk, this process's disk
+and character I/O, process CPU time and cgroup CPU throttling) on a fixed
+schedule into a bounded ring buffer. Per-second rates over rolling windows
+are computed from the deltas between two samples, so reading them costs
+nothing beyond a bisect, and sampling costs a few /proc reads.
+
+Seeing network/disk rates next to CPU usage and throttling makes it easy to
+tell whether a slowdown is I/O-bound or the CPU quota at work.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+import psutil
+
+DEFAULT_WINDOWS = (('10s', 10), ('1m', 60), ('5m', 300))
+
+# Counters shown per window, grouped for the JSON output
+COUNTER_GROUPS = {
+    "network": ('bytes_recv', 'bytes_sent', 'packets_recv', 'packets_sent',
+                'errin', 'errout', 'dropin', 'dropout'),
+    "disk": ('read_bytes', 'write_bytes', 'read_count', 'write_count'),
+    "process": ('read_bytes', 'write_bytes', 'read_chars', 'write_chars',
+                'read_count', 'write_count'),
+}
+
+CGROUP_CPU_STAT_FILES = (
+    ('/sys/fs/cgroup/cpu.stat', 'throttled_usec', 1),
+    ('/sys/fs/cgroup/cpu/cpu.stat', 'throttled_time', 1 / 1000),  # v1: ns
+    ('/sys/fs/cgroup/cpu,cpuacct/cpu.stat', 'throttled_time', 1 / 1000),
+)
+
+
+def _cgroup_throttled_usec():
+    for path, key, scale in CGROUP_CPU_STAT_FILES:
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    name, _, value = line.partition(' ')
+                    if name == key:
+                        return int(value) * scale
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def _as_dict(counters, fields):
+    if counters is None:
+        return {}
+    return {field: getattr(counters, field) for field in fields
+            if hasattr(counters, field)}
+
+
+class IORateSampler:
+    """
+    Scheduled sampler of cumulative I/O counters with rolling-window rates.
+
+    interval   seconds between samples
+    windows    (label, seconds) pairs rates are reported for
+    """
+
+    def __init__(self, interval=2.0, windows=DEFAULT_WINDOWS):
+        self.interval = interval
+        self.windows = windows
+        max_window = max(seconds for _, seconds in windows)
+        # One extra sample so the longest window has a full baseline
+        self._samples = deque(maxlen=int(max_window / interval) + 2)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._process = None
+
+    # ---------- sampling ----------
+
+    def sample(self):
+        """Read all counters once and append them to the ring buffer"""
+        if self._process is None or self._process.pid != os.getpid():
+            self._process = psutil.Process()
+        now = time.monotonic()
+        counters = {}
+
+        net = psutil.net_io_counters()
+        for field, value in _as_dict(net, COUNTER_GROUPS["network"]).items():
+            counters[f"network.{field}"] = value
+
+        disk = psutil.disk_io_counters()
+        for field, value in _as_dict(disk, COUNTER_GROUPS["disk"]).items():
+            counters[f"disk.{field}"] = value
+
+        try:
+            proc_io = self._process.io_counters()
+        except (psutil.AccessDenied, AttributeError):
+            proc_io = None
+        for field, value in _as_dict(proc_io, COUNTER_GROUPS["process"]).items():
+            counters[f"process.{field}"] = value
+
+        cpu = self._process.cpu_times()
+        counters["cpu.process_seconds"] = cpu.user + cpu.system
+        throttled = _cgroup_throttled_usec()
+        if throttled is not None:
+            counters["cpu.throttled_usec"] = throttled
+
+        with self._lock:
+            self._samples.append((now, counters))
+        return counters
+
+    def _run(self, pid):
+        while self._pid == pid:
+            try:
+                self.sample()
+            except (OSError, psutil.Error):
+                pass
+            time.sleep(self.interval)
+
+    def ensure_started(self):
+        """Start this process's sampling thread (again after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None \
+                    and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Samples inherited from the parent belong to another process
+                self._samples.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._pid,),
+                name='io-rates', daemon=True)
+            self._thread.start()
+
+    # ---------- rates ----------
+
+    @staticmethod
+    def _rates(old, new):
+        (t0, c0), (t1, c1) = old, new
+        elapsed = t1 - t0
+        # Groups are always present, even where psutil has no counters
+        grouped = {group: {} for group in COUNTER_GROUPS}
+        grouped["cpu"] = {}
+        grouped["span_seconds"] = round(elapsed, 1)
+        for key, value in c1.items():
+            if key not in c0:
+                continue
+            group, field = key.split('.', 1)
+            # Counters can reset (e.g. interface re-created); never go negative
+            delta = max(0, value - c0[key])
+            grouped[group][field] = delta / elapsed
+
+        for group in COUNTER_GROUPS:
+            for field, rate in grouped[group].items():
+                grouped[group][field] = round(rate, 1)
+
+        cpu = grouped.pop("cpu")
+        grouped["cpu"] = {
+            # Percent of one core, comparable with the container CPU limit
+            "process_percent": round(cpu.get("process_seconds", 0) * 100, 1),
+            "throttled_percent": round(cpu["throttled_usec"] / 1e6 * 100, 1)
+            if "throttled_usec" in cpu else None
+        }
+        return grouped
+
+    def snapshot(self):
+        """Per-second rates for every window, computed from buffered deltas"""
+        self.ensure_started()
+        with self._lock:
+            samples = list(self._samples)
+
+        result = {
+            "interval_seconds": self.interval,
+            "samples": len(samples),
+            "windows": {}
+        }
+        if len(samples) < 2:
+            for label, _ in self.windows:
+                result["windows"][label] = None
+            return result
+
+        timestamps = [t for t, _ in samples]
+        latest = samples[-1]
+        for label, seconds in self.windows:
+            # Oldest sample no older than the window; short history just
+            # yields a shorter span_seconds
+            start = bisect.bisect_left(timestamps, latest[0] - seconds - self.interval / 2)
+            start = min(start, len(samples) - 2)
+            result["windows"][label] = self._rates(samples[start], latest)
+        return result
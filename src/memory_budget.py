@@ -0,0 +1,321 @@
+"""
+Worker memory budget for ReproLab
+Keeps multi-worker deployments inside the container memory limit:
+freezes preloaded module state before forking so workers share those
+pages copy-on-write, samples each worker's RSS/USS, and asks a worker to
+recycle gracefully once it exceeds its memory budget, its request budget
+or grows too far past its post-warmup baseline (a leak guard).
+
+Worker status and recycle events are written to a shared state directory
+so any worker can report on all of them; the event log is trimmed to the
+most recent events so it stays cheap to read.
+"""
+import fcntl
+import gc
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import psutil
+
+MB = 1024 * 1024
+
+# cgroup v2 first, then v1
+CGROUP_LIMIT_FILES = (
+    '/sys/fs/cgroup/memory.max',
+    '/sys/fs/cgroup/memory/memory.limit_in_bytes',
+)
+CGROUP_USAGE_FILES = (
+    '/sys/fs/cgroup/memory.current',
+    '/sys/fs/cgroup/memory/memory.usage_in_bytes',
+)
+# Reclaimable page cache counted in the usage above (what `docker stats`
+# subtracts); (path, key) pairs, cgroup v2 first
+CGROUP_INACTIVE_FILE_STATS = (
+    ('/sys/fs/cgroup/memory.stat', 'inactive_file'),
+    ('/sys/fs/cgroup/memory/memory.stat', 'total_inactive_file'),
+)
+
+
+def freeze_for_fork():
+    """
+    Collect garbage and move every surviving object into the permanent
+    generation. Frozen objects are never touched by the collector, so a
+    forked worker does not dirty (and copy) the pages holding them.
+    Returns the number of frozen objects.
+    """
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def _read_cgroup_value(paths):
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == 'max':
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            continue
+        # v1 reports "unlimited" as a huge page-aligned number
+        return value if value < (1 << 60) else None
+    return None
+
+
+def _read_cgroup_stat(entries):
+    for path, key in entries:
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    name, _, value = line.partition(' ')
+                    if name == key:
+                        return int(value)
+        except (OSError, ValueError):
+            continue
+    return 0
+
+
+def container_memory():
+    """
+    Container (cgroup) memory limit and usage in MB, None when unknown.
+    Usage excludes inactive page cache, which the kernel reclaims before
+    the limit is hit, so file-heavy work does not look like memory pressure.
+    """
+    limit = _read_cgroup_value(CGROUP_LIMIT_FILES)
+    usage = _read_cgroup_value(CGROUP_USAGE_FILES)
+    if limit is None or usage is None:
+        return None
+    cache = min(usage, _read_cgroup_stat(CGROUP_INACTIVE_FILE_STATS))
+    usage -= cache
+    return {
+        "limit_mb": round(limit / MB, 2),
+        "usage_mb": round(usage / MB, 2),
+        "inactive_file_mb": round(cache / MB, 2),
+        "percent": round(usage / limit * 100, 1)
+    }
+
+
+def process_memory(process=None):
+    """
+    RSS and USS of a process in MB. USS (memory unique to the process) is
+    what a recycle actually frees; it falls back to RSS when smaps is not
+    readable.
+    """
+    process = process or psutil.Process()
+    try:
+        info = process.memory_full_info()
+        rss, uss = info.rss, getattr(info, 'uss', info.rss)
+    except (psutil.AccessDenied, psutil.ZombieProcess):
+        rss = uss = process.memory_info().rss
+    return {
+        "rss_mb": round(rss / MB, 2),
+        "uss_mb": round(uss / MB, 2)
+    }
+
+
+class MemoryBudget:
+    """
+    Per-worker memory accounting and recycle decisions.
+
+    budget_mb      recycle once the worker's USS exceeds this (0 disables)
+    max_requests   recycle after this many requests (0 disables)
+    growth_mb      recycle once USS grows this far past the warmup baseline
+                   (0 disables)
+    check_every    sample memory every N requests; USS reads smaps, which
+                   is too costly to do on every request
+    warmup         requests served before the growth baseline is taken
+    """
+
+    def __init__(self, budget_mb=0, max_requests=0, growth_mb=0,
+                 check_every=10, warmup=50, state_dir=None, max_events=50):
+        self.budget_mb = budget_mb
+        self.max_requests = max_requests
+        self.growth_mb = growth_mb
+        self.check_every = max(1, check_every)
+        self.warmup = warmup
+        self.state_dir = state_dir or os.path.join(
+            tempfile.gettempdir(), 'reprolab-memory')
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.reset_for_worker()
+
+    def reset_for_worker(self):
+        """Start fresh accounting; call in each worker right after fork"""
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.requests = 0
+        self.baseline = None
+        self.last_sample = None
+        self.recycle_reason = None
+
+    # ---------- per-request accounting ----------
+
+    def sample(self):
+        """Take a memory sample and persist this worker's status"""
+        sample = process_memory()
+        sample["timestamp"] = datetime.now().isoformat()
+        with self._lock:
+            self.last_sample = sample
+            if self.baseline is None and self.requests >= self.warmup:
+                self.baseline = sample["uss_mb"]
+        self._write_status()
+        return sample
+
+    def record_request(self):
+        """
+        Count a served request and, on sampling requests, check the budget.
+        Returns the recycle reason once the worker should be recycled,
+        otherwise None.
+        """
+        with self._lock:
+            self.requests += 1
+            requests = self.requests
+        if self.recycle_reason:
+            return self.recycle_reason
+
+        if self.max_requests and requests >= self.max_requests:
+            self.recycle_reason = f"max_requests ({requests} >= {self.max_requests})"
+            self.sample()
+            return self.recycle_reason
+
+        if requests % self.check_every:
+            return None
+
+        uss = self.sample()["uss_mb"]
+        if self.budget_mb and uss > self.budget_mb:
+            self.recycle_reason = f"memory_budget ({uss} MB > {self.budget_mb} MB)"
+        elif self.growth_mb and self.baseline is not None \
+                and uss - self.baseline > self.growth_mb:
+            self.recycle_reason = (
+                f"memory_growth ({round(uss - self.baseline, 2)} MB "
+                f"> {self.growth_mb} MB since warmup)")
+        return self.recycle_reason
+
+    def record_recycle(self, reason=None):
+        """Append a recycle event to the shared event log"""
+        event = {
+            "pid": self.pid,
+            "reason": reason or self.recycle_reason,
+            "requests": self.requests,
+            "uptime_seconds": round(time.time() - self.started, 2),
+            "memory": self.last_sample or process_memory(),
+            "timestamp": datetime.now().isoformat()
+        }
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(self._events_path(), 'a+') as f:
+            # Workers recycle concurrently; append and trim under one lock
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(json.dumps(event) + '\n')
+            self._trim_events(f)
+        return event
+
+    def worker_exited(self, pid):
+        """Remove a worker's status file once the master reaps it"""
+        try:
+            os.remove(self._status_path(pid))
+        except OSError:
+            pass
+
+    # ---------- reporting ----------
+
+    def status(self):
+        """This worker's accounting state"""
+        return {
+            "pid": self.pid,
+            "requests": self.requests,
+            "uptime_seconds": round(time.time() - self.started, 2),
+            "baseline_uss_mb": self.baseline,
+            "memory": self.last_sample,
+            "recycle_pending": self.recycle_reason
+        }
+
+    def report(self):
+        """Budget settings, every live worker's status and recent recycles"""
+        workers = []
+        if os.path.isdir(self.state_dir):
+            for name in sorted(os.listdir(self.state_dir)):
+                if not (name.startswith('worker-') and name.endswith('.json')):
+                    continue
+                try:
+                    with open(os.path.join(self.state_dir, name), 'r') as f:
+                        status = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if psutil.pid_exists(status.get("pid", -1)):
+                    workers.append(status)
+
+        if not any(w["pid"] == self.pid for w in workers):
+            current = self.status()
+            current["memory"] = current["memory"] or process_memory()
+            workers.append(current)
+
+        return {
+            "budget": {
+                "worker_budget_mb": self.budget_mb or None,
+                "max_requests": self.max_requests or None,
+                "growth_limit_mb": self.growth_mb or None,
+                "check_every_requests": self.check_every
+            },
+            "gc": {
+                "frozen_objects": gc.get_freeze_count(),
+                "counts": gc.get_count()
+            },
+            "container": container_memory(),
+            "current_worker": self.pid,
+            "workers": workers,
+            "recycle_events": self._read_events()
+        }
+
+    # ---------- state files ----------
+
+    def _status_path(self, pid=None):
+        return os.path.join(self.state_dir, f"worker-{pid or self.pid}.json")
+
+    def _events_path(self):
+        return os.path.join(self.state_dir, 'recycle-events.jsonl')
+
+    def _write_status(self):
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            path = self._status_path()
+            # Write then rename so readers never see a partial file
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.status(), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _trim_events(self, f):
+        """
+        Keep the event log bounded: once it holds twice max_events lines,
+        rewrite it with the newest max_events (amortised, not every write)
+        """
+        f.seek(0)
+        lines = f.readlines()
+        if len(lines) > 2 * self.max_events:
+            f.seek(0)
+            f.truncate()
+            f.writelines(lines[-self.max_events:])
+
+    def _read_events(self):
+        try:
+            with open(self._events_path(), 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            return []
+        events = []
+        for line in lines[-self.max_events:]:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+        return events
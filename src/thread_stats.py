@@ -0,0 +1,122 @@
+"""
+Per-thread CPU accounting for ReproLab
+Joins the kernel's per-thread CPU times (psutil.Process().threads()) with
+Python thread names and current stack frames (sys._current_frames()) so an
+incident can be traced to the thread that is eating the CPU quota.
+
+Rates are computed between two samples: the previous call's sample when it
+is recent, otherwise a second sample taken after a short interval. A sample
+is one /proc read per thread, so the endpoint is safe to hit while the
+process is already struggling.
+"""
+import os
+import sys
+import threading
+import time
+import traceback
+
+import psutil
+
+
+def _native_name(tid):
+    """Kernel thread name for threads Python does not know about"""
+    try:
+        with open(f'/proc/self/task/{tid}/comm', 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _format_stack(frame, depth):
+    return [
+        f"{entry.filename}:{entry.lineno} in {entry.name}"
+        + (f" | {entry.line}" if entry.line else "")
+        for entry in traceback.extract_stack(frame, limit=depth)
+    ]
+
+
+class ThreadProfiler:
+    """
+    Samples per-thread CPU time and reports the hottest threads.
+
+    max_age    a previous sample older than this (seconds) is not reused
+    """
+
+    def __init__(self, max_age=10.0):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._last = None  # (pid, monotonic time, {tid: (user, system)})
+
+    def _sample(self):
+        process = psutil.Process()
+        times = {t.id: (t.user_time, t.system_time) for t in process.threads()}
+        return time.monotonic(), times
+
+    def snapshot(self, interval=0.2, top=3, stack_depth=20):
+        """
+        Per-thread CPU rates, hottest first, with stacks for the `top`
+        hottest Python threads. `interval` is only slept when there is no
+        recent sample from a previous call to compare against.
+        """
+        pid = os.getpid()
+        with self._lock:
+            last = self._last
+        if last is None or last[0] != pid or time.monotonic() - last[1] > self.max_age:
+            last = (pid,) + self._sample()
+            time.sleep(interval)
+
+        now, times = self._sample()
+        with self._lock:
+            self._last = (pid, now, times)
+        elapsed = now - last[1]
+        previous = last[2]
+
+        # Before Python 3.12 a forked child's main thread (every gunicorn
+        # worker) keeps the parent's native_id; its tid is always the pid
+        main = threading.main_thread()
+        python_threads = {t.native_id: t for t in threading.enumerate() if t is not main}
+        python_threads[pid] = main
+        frames = sys._current_frames()
+        current_tid = threading.get_native_id()
+
+        threads = []
+        for tid, (user, system) in times.items():
+            prev_user, prev_system = previous.get(tid, (0.0, 0.0))
+            cpu_seconds = max(0.0, (user + system) - (prev_user + prev_system))
+            thread = python_threads.get(tid)
+            threads.append({
+                "tid": tid,
+                "name": thread.name if thread else _native_name(tid),
+                "python": thread is not None,
+                "daemon": thread.daemon if thread else None,
+                # Percent of one core over the sample span
+                "cpu_percent": round(cpu_seconds / elapsed * 100, 1) if elapsed > 0 else 0.0,
+                "user_seconds": round(user, 3),
+                "system_seconds": round(system, 3),
+                "new_since_last_sample": tid not in previous,
+                "is_current_request": tid == current_tid,
+                "_ident": thread.ident if thread else None
+            })
+        threads.sort(key=lambda t: t["cpu_percent"], reverse=True)
+
+        hottest = []
+        for entry in threads:
+            ident = entry.pop("_ident")
+            if len(hottest) < top and entry["cpu_percent"] > 0 and ident in frames:
+                hottest.append({
+                    "tid": entry["tid"],
+                    "name": entry["name"],
+                    "cpu_percent": entry["cpu_percent"],
+                    "is_current_request": entry["is_current_request"],
+                    "stack": _format_stack(frames[ident], stack_depth)
+                })
+        del frames  # Frames keep their locals alive; drop them promptly
+
+        return {
+            "pid": pid,
+            "sample_span_seconds": round(elapsed, 3),
+            "thread_count": len(threads),
+            "process_cpu_percent": round(sum(t["cpu_percent"] for t in threads), 1),
+            "hottest": hottest,
+            "threads": threads
+        }
@@ -12,11 +12,17 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
 from app import app
 
 @pytest.fixture
-def client():
+def client(tmp_path, monkeypatch):
     """Create a test client for the Flask app"""
     # Configure app for testing
     app.config['TESTING'] = True
     app.config['SECRET_KEY'] = 'test-secret-key'
+
+    # Keep disk I/O probe files out of the real temp directory; views use
+    # the module's probe, which a reload of the app module replaces
+    import app as app_module
+    monkeypatch.setattr(app_module.io_probe, 'base_dir', str(tmp_path))
+    monkeypatch.setattr(app_module.io_probe, '_dir', None)
     
     # Create test client
     with app.test_client() as client:
@@ -130,3 +136,542 @@ def test_cors_headers(client):
     # Flask doesn't add CORS by default, but we can check other headers
     assert 'Content-Type' in response.headers
     assert response.headers['Content-Type'] == 'application/json'
+
+def test_gzip_compression_negotiated(client):
+    """Test that large JSON responses are gzip-compressed when accepted"""
+    import gzip
+    response = client.get('/info', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    data = json.loads(gzip.decompress(response.data))
+    assert 'application' in data
+
+def test_no_compression_without_accept_encoding(client):
+    """Test that clients without Accept-Encoding get identity responses"""
+    response = client.get('/info')
+    assert 'Content-Encoding' not in response.headers
+    json.loads(response.data)
+
+    # gzip;q=0 explicitly refuses the encoding
+    response = client.get('/info', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in response.headers
+
+def test_small_responses_not_compressed(client):
+    """Test that bodies under COMPRESS_MIN_SIZE are sent as-is"""
+    response = client.get('/nonexistent', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 404
+    assert 'Content-Encoding' not in response.headers
+
+def test_dashboard_css_precompressed(client):
+    """Test that the dashboard stylesheet is served precompressed with an ETag"""
+    import gzip
+    from app import DASHBOARD_CSS
+    response = client.get('/assets/dashboard.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode('utf-8') == DASHBOARD_CSS
+
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"')
+    identity = client.get('/assets/dashboard.css')
+    assert identity.headers['ETag'] != etag
+
+    cached = client.get('/assets/dashboard.css', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+
+def test_negotiate_encoding_prefers_highest_quality():
+    """Test Accept-Encoding negotiation honours q-values"""
+    from compression import negotiate_encoding
+    assert negotiate_encoding('gzip, br', ['gzip']) == 'gzip'
+    assert negotiate_encoding('br;q=0.5, gzip;q=0.8', ['br', 'gzip']) == 'gzip'
+    assert negotiate_encoding('br, gzip', ['br', 'gzip']) == 'br'
+    assert negotiate_encoding('*', ['gzip']) == 'gzip'
+    assert negotiate_encoding('identity', ['gzip']) is None
+    assert negotiate_encoding('', ['gzip']) is None
+
+def test_memory_endpoint_reports_workers(client):
+    """Test memory endpoint reports the current worker and budget settings"""
+    response = client.get('/memory')
+    assert response.status_code == 200
+
+    data = json.loads(response.data)
+    assert 'budget' in data
+    assert 'recycle_events' in data
+    pids = [worker['pid'] for worker in data['workers']]
+    assert os.getpid() in pids
+
+def test_memory_budget_recycles_after_max_requests(tmp_path):
+    """Test a worker is flagged for recycling once its request budget is spent"""
+    from memory_budget import MemoryBudget
+    budget = MemoryBudget(max_requests=3, state_dir=str(tmp_path))
+    assert budget.record_request() is None
+    assert budget.record_request() is None
+    assert budget.record_request().startswith('max_requests')
+
+    budget.record_recycle()
+    events = budget.report()['recycle_events']
+    assert len(events) == 1
+    assert events[0]['pid'] == os.getpid()
+
+def test_memory_budget_bounds_recycle_event_log(tmp_path):
+    """Test the recycle event log is trimmed instead of growing forever"""
+    from memory_budget import MemoryBudget
+    budget = MemoryBudget(state_dir=str(tmp_path), max_events=5)
+    for i in range(23):
+        budget.record_recycle(reason=f"test {i}")
+
+    with open(tmp_path / 'recycle-events.jsonl') as f:
+        assert len(f.readlines()) <= 10
+    events = budget.report()['recycle_events']
+    assert [e['reason'] for e in events] == [f"test {i}" for i in range(18, 23)]
+
+def test_memory_budget_recycles_over_budget(tmp_path):
+    """Test a worker is flagged for recycling once USS exceeds its budget"""
+    from memory_budget import MemoryBudget
+    budget = MemoryBudget(budget_mb=0.001, check_every=1, state_dir=str(tmp_path))
+    assert budget.record_request().startswith('memory_budget')
+    assert (tmp_path / f'worker-{os.getpid()}.json').exists()
+
+def test_health_reports_disk_io_latency(client):
+    """Test health check includes the disk I/O latency probe"""
+    response = client.get('/health')
+    data = json.loads(response.data)
+    assert data['disk_io']['status'] in ('pass', 'slow')
+    assert 'fsync_ms' in data['disk_io']
+
+def test_io_stress_endpoint(client):
+    """Test I/O benchmark returns throughput and latency percentiles"""
+    response = client.get('/stress/io?size_mb=1&block_kb=4,64')
+    assert response.status_code == 200
+
+    data = json.loads(response.data)
+    assert data['test'] == 'io_stress_test'
+    assert set(data['results']['blocks']) == {'4096', '65536'}
+    block = data['results']['blocks']['4096']
+    for phase in ('sequential_write', 'sequential_read', 'random_read',
+                  'random_write', 'mmap_read'):
+        assert 'p99_ms' in block[phase]['latency']
+    assert 'p50_ms' in block['fsync']
+
+def test_io_stress_rejects_bad_params(client):
+    """Test I/O benchmark validates its query parameters"""
+    assert client.get('/stress/io?size_mb=abc').status_code == 400
+    assert client.get('/stress/io?block_kb=0').status_code == 400
+    assert client.get('/stress/io?block_kb=500000').status_code == 400
+
+def test_io_probe_rejects_blocks_above_size_cap(tmp_path):
+    """Test benchmark block sizes are bounded by max_size_mb"""
+    from io_probe import IOProbe
+    probe = IOProbe(base_dir=str(tmp_path), max_size_mb=1)
+    with pytest.raises(ValueError):
+        probe.benchmark(size_mb=1, block_sizes=[8 * 1024 * 1024])
+
+def test_deployment_endpoint_reports_watcher(client, tmp_path, monkeypatch):
+    """Test deployment endpoint reports the watcher state file"""
+    watcher, _, _, _ = make_watcher(tmp_path)
+    watcher.poll_once()
+    state_file = tmp_path / 'deploy.json'
+
+    # Views read the module-level app, which may have been reloaded above
+    import app as app_module
+    monkeypatch.setitem(app_module.app.config, 'DEPLOY_STATE_FILE', str(state_file))
+    response = client.get('/deployment')
+    watcher = json.loads(response.data)['deployment']['watcher']
+    assert watcher['running'] is True
+    assert watcher['version'] == 'v1'
+
+def test_deployment_endpoint_reports_stale_watcher_stopped(client, tmp_path, monkeypatch):
+    """Test a state file whose watcher missed its heartbeat is not 'running'"""
+    import time
+    state_file = tmp_path / 'deploy.json'
+    state_file.write_text(json.dumps({
+        "version": "abc123",
+        "heartbeat_deadline": time.time() - 3600,
+        "history": []
+    }))
+
+    import app as app_module
+    monkeypatch.setitem(app_module.app.config, 'DEPLOY_STATE_FILE', str(state_file))
+    response = client.get('/deployment')
+    watcher = json.loads(response.data)['deployment']['watcher']
+    assert watcher['running'] is False
+    assert watcher['version'] == 'abc123'
+
+class RecordingReloader:
+    """Stand-in for GunicornReloader that tracks the running code fingerprint"""
+
+    def __init__(self, code_dir):
+        from deploy_watcher import code_fingerprint
+        self.running = code_fingerprint(str(code_dir))
+        self.calls = 0
+        self.ready_timeout = 60
+        self.drain_timeout = 60
+        self.health_down = 0  # polls for which /health does not answer
+
+    def running_fingerprint(self):
+        if self.health_down:
+            self.health_down -= 1
+            return None
+        return self.running
+
+    def reload(self, expected_fingerprint=None):
+        self.calls += 1
+        self.running = expected_fingerprint
+        return {"cutover_seconds": 0.5}
+
+def make_watcher(tmp_path, **kwargs):
+    from deploy_watcher import Backoff, DeployWatcher, FileSource
+    code_dir = tmp_path / 'code'
+    code_dir.mkdir()
+    (code_dir / 'app.py').write_text('VERSION = 1\n')
+    version_file = tmp_path / 'version'
+    version_file.write_text('v1')
+    reloader = RecordingReloader(code_dir)
+    watcher = DeployWatcher(FileSource(str(version_file)), reloader,
+                            backoff=Backoff(min_interval=10, max_interval=40, factor=2, jitter=0),
+                            state_file=str(tmp_path / 'deploy.json'),
+                            code_dir=str(code_dir), **kwargs)
+    return watcher, reloader, version_file, code_dir
+
+def test_deploy_watcher_reloads_on_change(tmp_path):
+    """Test the watcher reloads only when the source version changes"""
+    watcher, reloader, version_file, code_dir = make_watcher(tmp_path)
+
+    assert watcher.poll_once() == 20  # baseline, no reload
+    assert watcher.poll_once() == 40  # unchanged, backing off
+    assert reloader.calls == 0
+
+    version_file.write_text('v2-new')
+    (code_dir / 'app.py').write_text('VERSION = 2\n')
+    assert watcher.poll_once() == 10  # change resets the interval
+    assert reloader.calls == 1
+    assert watcher.state['version'] == 'v2-new'
+    assert watcher.state['history'][0]['cutover_seconds'] == 0.5
+    assert watcher.state['history'][0]['previous_version'] == 'v1'
+
+def test_deploy_watcher_fails_when_code_unchanged(tmp_path):
+    """Test a new version whose code never reached disk is not reported as deployed"""
+    watcher, reloader, version_file, _ = make_watcher(tmp_path)
+    watcher.poll_once()
+
+    version_file.write_text('v2-image-only')
+    watcher.poll_once()
+    assert reloader.calls == 0
+    assert watcher.state['last_deployment']['status'] == 'failed'
+    assert 'unchanged' in watcher.state['last_deployment']['error']
+    assert watcher.state['version'] == 'v1'
+
+def test_registry_image_sources_rejected():
+    """Test registry manifests cannot be used for in-place reload"""
+    from deploy_watcher import DeployError, source_from_spec
+    with pytest.raises(DeployError):
+        source_from_spec('https://ghcr.io/v2/owner/repo/manifests/latest')
+
+def test_info_reports_io_rates(client):
+    """Test /info includes rolling I/O rate windows"""
+    response = client.get('/info')
+    data = json.loads(response.data)
+    assert 'io' in data
+    assert set(data['io']['windows']) == {'10s', '1m', '5m'}
+
+def test_io_rates_computed_from_deltas():
+    """Test rates are per-second deltas between buffered samples"""
+    from io_rates import IORateSampler
+    sampler = IORateSampler(interval=1, windows=(('10s', 10),))
+    sampler.ensure_started = lambda: None
+    for t, recv in ((0, 1000), (5, 6000), (10, 11000)):
+        sampler._samples.append((t, {"network.bytes_recv": recv,
+                                     "cpu.process_seconds": t * 0.25}))
+
+    window = sampler.snapshot()['windows']['10s']
+    assert window['span_seconds'] == 10
+    assert window['network']['bytes_recv'] == 1000
+    assert window['cpu']['process_percent'] == 25
+
+def test_debug_threads_lists_threads(client):
+    """Test thread endpoint reports per-thread CPU for the process"""
+    response = client.get('/debug/threads?interval=0.05')
+    assert response.status_code == 200
+
+    data = json.loads(response.data)
+    assert data['pid'] == os.getpid()
+    names = [thread['name'] for thread in data['threads']]
+    assert 'MainThread' in names
+    assert all('cpu_percent' in thread for thread in data['threads'])
+
+def test_debug_threads_finds_hot_thread():
+    """Test a busy thread is reported among the hottest, with its stack"""
+    import threading
+    import time
+    from thread_stats import ThreadProfiler
+
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            sum(range(1000))
+
+    busy = threading.Thread(target=spin, name='busy-test', daemon=True)
+    busy.start()
+    try:
+        time.sleep(0.05)
+        data = ThreadProfiler().snapshot(interval=0.3, top=3)
+    finally:
+        stop.set()
+        busy.join()
+
+    hot = [t for t in data['hottest'] if t['name'] == 'busy-test']
+    assert hot, data['hottest']
+    assert any('in spin' in frame for frame in hot[0]['stack'])
+
+def test_debug_threads_names_main_thread_after_fork():
+    """Test a forked worker's main thread is matched to Python and gets a stack"""
+    import time
+    from thread_stats import ThreadProfiler
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            profiler = ThreadProfiler()
+            profiler.snapshot(interval=0.01)
+            deadline = time.monotonic() + 0.3
+            while time.monotonic() < deadline:
+                sum(range(1000))
+            os.write(write_fd, json.dumps(profiler.snapshot(top=1)).encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as f:
+        data = json.loads(f.read())
+    os.waitpid(pid, 0)
+
+    main = [t for t in data['threads'] if t['tid'] == pid]
+    assert main[0]['name'] == 'MainThread'
+    assert main[0]['python'] is True
+    assert data['hottest'][0]['tid'] == pid
+    assert data['hottest'][0]['stack']
+
+def test_debug_threads_rejects_bad_params(client):
+    """Test thread endpoint validates its query parameters"""
+    assert client.get('/debug/threads?top=abc').status_code == 400
+
+def test_container_memory_excludes_inactive_page_cache(tmp_path, monkeypatch):
+    """Test container memory usage does not count reclaimable page cache"""
+    import memory_budget
+    (tmp_path / 'memory.max').write_text('1000\n')
+    (tmp_path / 'memory.current').write_text('950\n')
+    (tmp_path / 'memory.stat').write_text('anon 300\ninactive_file 600\n')
+    monkeypatch.setattr(memory_budget, 'CGROUP_LIMIT_FILES', (str(tmp_path / 'memory.max'),))
+    monkeypatch.setattr(memory_budget, 'CGROUP_USAGE_FILES', (str(tmp_path / 'memory.current'),))
+    monkeypatch.setattr(memory_budget, 'CGROUP_INACTIVE_FILE_STATS',
+                        ((str(tmp_path / 'memory.stat'), 'inactive_file'),))
+
+    assert memory_budget.container_memory()['percent'] == 35.0
+
+def test_io_probe_removes_exited_worker_dirs(tmp_path):
+    """Test a worker's probe directory is removed once it exits"""
+    from io_probe import IOProbe
+    probe = IOProbe(base_dir=str(tmp_path))
+    probe.latency_check()
+    assert list(tmp_path.glob(f'reprolab-io-{os.getpid()}-*'))
+
+    probe.worker_exited(os.getpid())
+    assert not list(tmp_path.glob('reprolab-io-*'))
+
+def test_io_probe_removes_dir_at_exit(tmp_path):
+    """Test a process outside gunicorn removes its probe directory on exit"""
+    import subprocess
+    src = os.path.join(os.path.dirname(__file__), '..', 'src')
+    subprocess.run([sys.executable, '-c',
+                    f"from io_probe import IOProbe; IOProbe(base_dir={str(tmp_path)!r}).latency_check()"],
+                   cwd=src, check=True, timeout=30)
+    assert not list(tmp_path.glob('reprolab-io-*'))
+
+def test_reload_refused_when_master_is_container_main_process():
+    """Test in-place reload is refused where it would stop the container"""
+    from deploy_watcher import stops_container
+
+    class FakeProcess:
+        def __init__(self, pid, name='python', parent=None):
+            self.pid = pid
+            self._name = name
+            self._parent = parent
+
+        def name(self):
+            return self._name
+
+        def parent(self):
+            return self._parent
+
+    assert stops_container(FakeProcess(1))
+    assert stops_container(FakeProcess(7, parent=FakeProcess(1, 'docker-init')))
+    assert not stops_container(FakeProcess(7, parent=FakeProcess(1, 'systemd')))
+    assert not stops_container(FakeProcess(7, parent=FakeProcess(3, 'bash')))
+
+def test_deploy_watcher_skips_failed_release(tmp_path):
+    """Test a failed release is not redeployed until the source changes again"""
+    watcher, reloader, version_file, code_dir = make_watcher(tmp_path)
+    watcher.poll_once()
+
+    version_file.write_text('v2-broken')
+    assert watcher.poll_once() == 40  # failed: backs off instead of resetting
+    assert watcher.state['failed_version'] == 'v2-broken'
+    assert watcher.poll_once() == 40  # same release is skipped
+    assert len(watcher.state['history']) == 1
+
+    version_file.write_text('v3-fixed')
+    (code_dir / 'app.py').write_text('VERSION = 3\n')
+    assert watcher.poll_once() == 10
+    assert reloader.calls == 1
+    assert watcher.state['version'] == 'v3-fixed'
+    assert watcher.state['failed_version'] is None
+
+def test_reload_treats_vanished_old_master_as_drained(tmp_path, monkeypatch):
+    """Test an old master reaped mid-check still counts as a drained cutover"""
+    import psutil
+    import deploy_watcher
+
+    pidfile = tmp_path / 'gunicorn.pid'
+    pidfile.write_text('100')
+
+    class FakeMaster:
+        def __init__(self, pid):
+            self.pid = pid
+
+        def parent(self):
+            return None
+
+        def children(self):
+            return [object(), object()]
+
+        def is_running(self):
+            return True
+
+        def status(self):
+            # Old master is reaped right after is_running() said yes
+            raise psutil.NoSuchProcess(self.pid)
+
+    def fake_kill(pid, sig):
+        if sig == deploy_watcher.signal.SIGUSR2:
+            (tmp_path / 'gunicorn.pid.2').write_text('200')
+
+    monkeypatch.setattr(deploy_watcher.psutil, 'Process', FakeMaster)
+    monkeypatch.setattr(deploy_watcher.psutil, 'pid_exists', lambda pid: True)
+    monkeypatch.setattr(deploy_watcher.os, 'kill', fake_kill)
+
+    reloader = deploy_watcher.GunicornReloader(
+        pidfile=str(pidfile), ready_timeout=1, drain_timeout=1, poll=0.01)
+    result = reloader.reload()
+    assert result['new_master_pid'] == 200
+    assert result['old_master_drained'] is True
+
+def test_deploy_watcher_retries_after_health_outage(tmp_path):
+    """Test a deploy that failed only because /health was down is retried"""
+    watcher, reloader, version_file, code_dir = make_watcher(tmp_path)
+    watcher.poll_once()
+
+    version_file.write_text('v2')
+    (code_dir / 'app.py').write_text('VERSION = 2\n')
+    reloader.health_down = 1
+    assert watcher.poll_once() == 40  # failed, backing off
+    assert watcher.state['last_deployment']['retryable'] is True
+    assert watcher.state.get('failed_version') is None
+
+    watcher.poll_once()
+    assert reloader.calls == 1
+    assert watcher.state['version'] == 'v2'
+    assert watcher.state['retry'] is None
+
+def test_deploy_watcher_gives_up_after_max_attempts(tmp_path):
+    """Test a release that keeps failing transiently is eventually skipped"""
+    watcher, reloader, version_file, code_dir = make_watcher(tmp_path, max_attempts=2)
+    watcher.poll_once()
+
+    version_file.write_text('v2')
+    (code_dir / 'app.py').write_text('VERSION = 2\n')
+    reloader.health_down = 10
+    watcher.poll_once()
+    watcher.poll_once()
+    assert watcher.state['failed_version'] == 'v2'
+    watcher.poll_once()
+    assert len(watcher.state['history']) == 2  # skipped, not attempted again
+
+def test_deploy_watcher_rolls_out_when_source_ahead_at_start(tmp_path):
+    """Test the first poll deploys when the code on disk is not what is running"""
+    watcher, reloader, version_file, code_dir = make_watcher(tmp_path)
+    version_file.write_text('v2')
+    (code_dir / 'app.py').write_text('VERSION = 2\n')
+
+    watcher.poll_once()
+    assert reloader.calls == 1
+    assert watcher.state['version'] == 'v2'
+    assert watcher.state['history'][0]['previous_version'] is None
+
+def test_reload_refused_while_previous_master_drains(tmp_path, monkeypatch):
+    """Test no reload starts while the pidfile and pidfile.2 name live masters"""
+    import deploy_watcher
+    pidfile = tmp_path / 'gunicorn.pid'
+    pidfile.write_text(str(os.getppid()))  # old master, still draining
+    (tmp_path / 'gunicorn.pid.2').write_text(str(os.getpid()))  # serving master
+    signals = []
+    real_kill = os.kill
+
+    def record_kill(pid, sig):
+        if sig == 0:  # psutil.pid_exists probes with signal 0
+            return real_kill(pid, sig)
+        signals.append(sig)
+
+    monkeypatch.setattr(deploy_watcher.os, 'kill', record_kill)
+
+    reloader = deploy_watcher.GunicornReloader(pidfile=str(pidfile))
+    with pytest.raises(deploy_watcher.DeployError, match='draining'):
+        reloader.reload()
+    assert signals == []
+
+def test_deploy_watcher_waits_for_app_before_baseline(tmp_path):
+    """Test a baseline check while /health is not up yet is retried, not recorded"""
+    watcher, reloader, _, _ = make_watcher(tmp_path)
+    reloader.health_down = 1
+    watcher.poll_once()
+    assert watcher.state['history'] == []
+    assert 'fingerprint' in watcher.state['last_error']
+    assert watcher.state.get('version') is None
+
+    watcher.poll_once()
+    assert watcher.state['version'] == 'v1'
+    assert watcher.state['last_error'] is None
+    assert reloader.calls == 0
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='child subreaper is Linux-only')
+def test_supervisor_outlives_handed_off_process(tmp_path):
+    """Test the entrypoint keeps running until the process it was handed off to exits"""
+    import subprocess
+    import time
+    marker = tmp_path / 'done'
+    pidfile = tmp_path / 'gunicorn.pid'
+    # Like a USR2 handoff: the started process forks a successor, which is
+    # recorded in <pidfile>.2, and exits
+    handoff = (
+        "import os, sys, time\n"
+        "pid = os.fork()\n"
+        "if pid:\n"
+        f"    open({str(pidfile)!r} + '.2', 'w').write(str(pid))\n"
+        "    sys.exit(0)\n"
+        "time.sleep(1)\n"
+        f"open({str(marker)!r}, 'w').write('done')\n"
+        "sys.exit(3)\n"
+    )
+    src = os.path.join(os.path.dirname(__file__), '..', 'src')
+    env = dict(os.environ, GUNICORN_PIDFILE=str(pidfile))
+    env.pop('DEPLOY_SOURCE', None)
+    start = time.monotonic()
+    result = subprocess.run(
+        [sys.executable, 'deploy_watcher.py', 'supervise', sys.executable, '-c', handoff],
+        cwd=src, env=env, timeout=30)
+    assert time.monotonic() - start >= 1
+    assert marker.exists()
+    assert result.returncode == 3